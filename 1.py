@@ -1,13 +1,13 @@
-import os, time, json, re, hashlib, logging, threading
+import os, time, mmap, re, random, hashlib, heapq, logging, asyncio, importlib.util
 from datetime import datetime, timezone
 from pathlib import Path
 
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
+import ijson
+import orjson
+import regex
 
-from bs4 import BeautifulSoup
-from telegram import Bot
+from lxml import etree, html as lh
 from fastapi import FastAPI
 import uvicorn
 
@@ -26,7 +26,12 @@ else:
 TELEGRAM_TOKEN_RAW = os.getenv("TG_TOKEN", "")
 CHAT_ID = os.getenv("TG_CHAT_ID")
 POLL_INTERVAL_SEC = int(os.getenv("POLL_INTERVAL_SEC", "60"))
+# потолок паузы при серии ошибок; не меньше обычного интервала, иначе ошибка ускорит опрос
+POLL_INTERVAL_MAX_SEC = max(600, POLL_INTERVAL_SEC)
 FILTER_MARKETS = [p.strip().upper() + "-" for p in os.getenv("FILTER_MARKETS", "KRW,USDT").split(",") if p.strip()]
+FILTER_PREFIX_SET = frozenset(FILTER_MARKETS)
+# REST API Upbit отдаёт ETag нестабильно — условный GET для рынков включается явно
+MARKETS_CONDITIONAL_GET = os.getenv("MARKETS_CONDITIONAL_GET", "0").strip().lower() in ("1", "true", "yes")
 
 # Нормализуем токен (срезаем кавычки/пробелы на концах)
 TELEGRAM_TOKEN = TELEGRAM_TOKEN_RAW.strip().strip('"').strip("'")
@@ -48,44 +53,78 @@ if not CHAT_ID:
 
 UPBIT_MARKETS_URL = "https://api.upbit.com/v1/market/all"
 UPBIT_NOTICES_URL = "https://upbit.com/service_center/notice"
+TG_SEND_URL = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
 
 CACHE_FILE = str(ROOT_DIR / "upbit_markets_cache.json")
 NOTICES_CACHE_FILE = str(ROOT_DIR / "upbit_notices_cache.json")
+NOTICES_CACHE_MAX = 5000  # сколько последних id объявлений помним
+NOTICE_ID_ALGO = "blake2b-8"  # пишется в кэш объявлений; без него id — старые sha256[:16]
 
-HDRS = {"User-Agent": "UpbitListingsBot/1.3 (+local)"}
+# br просим, только если httpx сможет его распаковать (нужен brotli или brotlicffi)
+HAS_BROTLI = any(importlib.util.find_spec(m) for m in ("brotli", "brotlicffi"))
+
+HDRS = {
+    "User-Agent": "UpbitListingsBot/1.3 (+local)",
+    # без "Connection": в HTTP/2 этот заголовок запрещён, а в HTTP/1.1 keep-alive и так по умолчанию
+    "Accept-Encoding": "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate",
+}
+
+# три хоста (api.upbit.com, upbit.com, api.telegram.org) — держим соединения открытыми между циклами
+HTTP_POOL_SIZE = 4
+HTTP_KEEPALIVE_SEC = max(POLL_INTERVAL_SEC * 3, 300)
 
 # ===================== HTTP с ретраями =====================
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+RETRY_TOTAL = 3
+RETRY_BACKOFF_SEC = 1.5
+
+class RetryTransport(httpx.AsyncHTTPTransport):
+    """Повторяет GET/HEAD при 429/5xx с экспоненциальной паузой (как Retry из urllib3)."""
+
+    async def handle_async_request(self, request):
+        for attempt in range(RETRY_TOTAL + 1):
+            response = await super().handle_async_request(request)
+            if (
+                request.method not in ("GET", "HEAD")
+                or response.status_code not in RETRY_STATUSES
+                or attempt == RETRY_TOTAL
+            ):
+                return response
+            try:
+                delay = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                delay = RETRY_BACKOFF_SEC * 2 ** attempt
+            await response.aclose()
+            await asyncio.sleep(min(delay, 60))
+
 def build_http():
-    s = requests.Session()
-    try:
-        retries = Retry(
-            total=3, connect=3, read=3, status=3,
-            backoff_factor=1.5,
-            status_forcelist=(429, 500, 502, 503, 504),
-            allowed_methods=frozenset(["GET", "HEAD"]),
-        )
-    except TypeError:
-        # совместимость со старыми версиями urllib3
-        retries = Retry(
-            total=3, connect=3, read=3, status=3,
-            backoff_factor=1.5,
-            status_forcelist=(429, 500, 502, 503, 504),
-            method_whitelist=frozenset(["GET", "HEAD"]),
-        )
-    adapter = HTTPAdapter(max_retries=retries)
-    s.mount("https://", adapter)
-    s.mount("http://", adapter)
-    s.headers.update(HDRS)
-    return s
+    # один общий асинхронный клиент на источники и Telegram; ретраи соединения — в httpx,
+    # ретраи по статусу (429/5xx) — в RetryTransport
+    # HTTP/2 (пакет h2): одно мультиплексируемое соединение на хост, заголовки сжимаются HPACK
+    # keepalive_expiry больше интервала опроса, иначе пул закрывает соединения
+    # между циклами и каждый опрос заново делает TCP+TLS рукопожатие
+    limits = httpx.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_SEC,
+    )
+    transport = RetryTransport(retries=3, http2=True, limits=limits)
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        follow_redirects=True,
+        headers=HDRS,
+        limits=limits,
+        transport=transport,
+    )
 
 HTTP = build_http()
 
 # ===================== ЛОГИ =====================
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger("upbit-bot")
-
-# ===================== TELEGRAM КЛИЕНТ =====================
-bot = Bot(token=TELEGRAM_TOKEN)
+# httpx пишет каждый запрос на INFO, включая URL Telegram с токеном
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # ===================== HEALTH =====================
 last_cycle_ok = True
@@ -94,11 +133,17 @@ last_cycle_at = None
 app = FastAPI()
 
 @app.get("/health")
-def health():
+async def health():
     return {"ok": last_cycle_ok, "last_cycle_at": last_cycle_at, "filter_markets": FILTER_MARKETS}
 
-def run_http():
-    uvicorn.run(app, host="0.0.0.0", port=8080, log_level="warning")
+async def serve_http():
+    # тот же event loop, что и у поллера — без отдельного потока
+    config = uvicorn.Config(app, host="0.0.0.0", port=8080, log_level="warning", loop="asyncio")
+    try:
+        await uvicorn.Server(config).serve()
+    except (SystemExit, OSError) as e:
+        # например, порт занят: uvicorn делает sys.exit — /health не будет, но опрос продолжаем
+        log.error("Health-сервер не запустился: %r", e)
 
 def mark_ok():
     global last_cycle_ok, last_cycle_at
@@ -111,133 +156,319 @@ def mark_fail():
 
 # ===================== УТИЛИТЫ =====================
 def load_cache(path, default):
+    # orjson разбирает байты напрямую из отображённого файла — без read() и декодирования в str
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as mv:
+                return orjson.loads(mv)
     except Exception:
+        # нет файла, пустой файл (mmap не отображает 0 байт) или битый JSON
         return default
 
 def save_cache(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def send_message(text: str):
+    # пишем во временный файл и атомарно подменяем: падение посреди записи не бьёт кэш
+    buf = memoryview(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # os.write может записать не всё за раз — дописываем хвост без копий
+        while buf:
+            buf = buf[os.write(fd, buf):]
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+
+# token bucket: Telegram режет чаще ~1 сообщения/сек в один чат и банит за RetryAfter-штормы
+_tb_lock = asyncio.Lock()
+_tb_tokens = 5.0
+_tb_last = time.monotonic()
+
+async def _acquire_token(rate=1.0, burst=5):
+    global _tb_tokens, _tb_last
+    async with _tb_lock:
+        while True:
+            now = time.monotonic()
+            _tb_tokens = min(burst, _tb_tokens + (now - _tb_last) * rate)
+            _tb_last = now
+            if _tb_tokens >= 1:
+                _tb_tokens -= 1
+                return
+            await asyncio.sleep((1 - _tb_tokens) / rate)
+
+async def send_message(text: str):
     if not CHAT_ID:
         log.warning("CHAT_ID пуст, пропускаю отправку: %s", text)
         return
-    try:
-        bot.send_message(chat_id=CHAT_ID, text=text)
-    except Exception as e:
-        log.error("Ошибка отправки в Telegram (chat_id=%s): %s", CHAT_ID, e)
+    for attempt in range(2):
+        await _acquire_token()
+        try:
+            r = await HTTP.post(TG_SEND_URL, json={"chat_id": CHAT_ID, "text": text})
+            if r.is_success:
+                return
+            body = orjson.loads(r.content) if r.content else {}
+        except Exception as e:
+            # текст httpx-ошибок без URL, токен в лог не попадает
+            log.error("Ошибка отправки в Telegram (chat_id=%s): %s", CHAT_ID, e)
+            return
+        retry_after = body.get("parameters", {}).get("retry_after")
+        if r.status_code == 429 and retry_after and not attempt:
+            log.warning("Telegram просит подождать %s c", retry_after)
+            await asyncio.sleep(retry_after)
+            continue
+        log.error("Ошибка отправки в Telegram (chat_id=%s): %s %s", CHAT_ID, r.status_code, body.get("description"))
+        return
+
+# отправка не должна задерживать следующий цикл опроса; держим ссылки, чтобы задачи не собрал GC
+_send_tasks = set()
+
+def send_in_background(text: str):
+    task = asyncio.create_task(send_message(text))
+    _send_tasks.add(task)
+    task.add_done_callback(_send_tasks.discard)
 
 # ===================== ИСТОЧНИКИ ДАННЫХ =====================
-def fetch_markets():
-    r = HTTP.get(UPBIT_MARKETS_URL, timeout=30)
-    r.raise_for_status()
-    return r.json()  # [{market, korean_name, english_name, ...}]
+# валидаторы для условного GET: при 304 отдаём результат прошлого запроса
+_markets_etag = None
+_markets_lastmod = None
+_last_markets = frozenset()
+
+_notices_etag = None
+_notices_lastmod = None
+_last_parsed_notices = []
+_notices_not_modified = False  # последний запрос объявлений вернул 304
+
+_http_version_logged = set()
+
+def _log_http_version(resp):
+    # один раз на хост: видно, договорились ли о HTTP/2 (нужен пакет h2)
+    host = resp.url.host
+    if host not in _http_version_logged:
+        _http_version_logged.add(host)
+        log.debug("%s: %s", host, resp.http_version)
+
+def _conditional_headers(etag, lastmod):
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if lastmod:
+        headers["If-Modified-Since"] = lastmod
+    return headers
+
+class _AsyncBodyReader:
+    """Файлоподобная обёртка над телом потокового ответа httpx для ijson."""
+
+    def __init__(self, response):
+        self._chunks = response.aiter_bytes()
+        self._buf = b""
+
+    async def read(self, size=-1):
+        # ijson сначала зовёт read(0), чтобы узнать тип потока, — тут нельзя терять данные
+        if size == 0:
+            return b""
+        if not self._buf:
+            try:
+                self._buf = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return b""
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+async def fetch_markets(known=None):
+    """Возвращает (коды всех рынков, {код: (english_name, korean_name)} для новых рынков под фильтром)."""
+    global _markets_etag, _markets_lastmod, _last_markets
+    headers = _conditional_headers(_markets_etag, _markets_lastmod) if MARKETS_CONDITIONAL_GET else {}
+    async with HTTP.stream("GET", UPBIT_MARKETS_URL, headers=headers) as r:
+        _log_http_version(r)
+        if r.status_code == 304:
+            return _last_markets, {}
+        r.raise_for_status()
+        current = set()
+        names = {}
+        # [{market, korean_name, english_name, ...}] разбираем по мере прихода, без списка целиком;
+        # aiter_bytes отдаёт уже распакованные (gzip/br) байты, строка str не строится
+        async for m in ijson.items(_AsyncBodyReader(r), "item"):
+            mk = m["market"]
+            current.add(mk)
+            # имена нужны только для уведомления — берём их лишь у новых рынков под фильтром
+            if known is not None and mk not in known and _passes_prefix_filter(mk):
+                names[mk] = (m.get("english_name", ""), m.get("korean_name", ""))
+    current = frozenset(current)
+    if MARKETS_CONDITIONAL_GET:
+        _markets_etag = r.headers.get("ETag")
+        _markets_lastmod = r.headers.get("Last-Modified")
+        _last_markets = current
+    return current, names
+
+_LISTING_WORDS = r"상장|리스트|listing|마켓\s*추가|market\s*support|new\s*listing"
+_NOTICE_MARKET_WORDS = r"krw|원화|usdt|테더|유에스디티"
+
+LISTING_RE = re.compile(rf"({_LISTING_WORDS})", re.I)
+# для заголовков: одна проверка «ключевое слово листинга + KRW/USDT» в любом порядке;
+# текст уже приведён через casefold(), так что флаг I не нужен
+NOTICE_TITLE_CF = regex.compile(
+    rf"(?:{_LISTING_WORDS}).*?(?:{_NOTICE_MARKET_WORDS})|(?:{_NOTICE_MARKET_WORDS}).*?(?:{_LISTING_WORDS})",
+    regex.S,
+)
+# грубый отбор ссылок внутри lxml (XPath не умеет \s* — ищем по корням слов),
+# точная проверка регулярками идёт уже по уцелевшим
+_LOWER = "translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+LISTING_LINKS_XPATH = etree.XPath(
+    f"//a[@href][contains({_LOWER}, 'listing') or contains({_LOWER}, 'market')"
+    " or contains(., '상장') or contains(., '리스트') or contains(., '마켓')]"
+)
+
+def _parse_notices(html: str) -> list:
+    # нет ни одного ключевого слова на всей странице — нечего и парсить
+    if not LISTING_RE.search(html):
+        return []
+
+    doc = lh.fromstring(html)
+    items = []
+    for a in LISTING_LINKS_XPATH(doc):
+        title = (a.text_content() or "").strip()
+        href = a.get("href")
+        if not title or not href:
+            continue
+        # ключевые слова листинга + фильтр по KRW/USDT в заголовке Notice
+        if not NOTICE_TITLE_CF.search(title.casefold()):
+            continue
+        if href.startswith("/"):
+            href = "https://upbit.com" + href
+        uniq = hashlib.blake2b((title + "|" + href).encode("utf-8"), digest_size=8).hexdigest()
+        items.append({"id": uniq, "title": title, "url": href})
+    return items
 
-NOTICE_MARKET_PATTERN = re.compile(r"(KRW|원화|USDT|테더|유에스디티)", re.I)
+def _legacy_notice_id(item) -> str:
+    # id до перехода на BLAKE2b — нужен только для миграции старого кэша
+    return hashlib.sha256((item["title"] + "|" + item["url"]).encode("utf-8")).hexdigest()[:16]
 
-def fetch_listing_notices():
+async def fetch_listing_notices():
+    global _notices_etag, _notices_lastmod, _last_parsed_notices, _notices_not_modified
+    _notices_not_modified = False
     try:
-        resp = HTTP.get(UPBIT_NOTICES_URL, timeout=30)
+        resp = await HTTP.get(UPBIT_NOTICES_URL, headers=_conditional_headers(_notices_etag, _notices_lastmod))
+        _log_http_version(resp)
+        if resp.status_code == 304:
+            _notices_not_modified = True
+            return _last_parsed_notices
         resp.raise_for_status()
         html = resp.text
-    except requests.Timeout:
+    except httpx.TimeoutException:
         log.warning("Notice timeout: %s", UPBIT_NOTICES_URL)
         return []
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         log.warning("Notice request error: %s", e)
         return []
 
-    soup = BeautifulSoup(html, "html.parser")
-    items = []
-    for a in soup.find_all("a", href=True):
-        title = (a.get_text() or "").strip()
-        href = a["href"]
-        if not title or not href:
-            continue
-        if href.startswith("/"):
-            href = "https://upbit.com" + href
-        # ключевые слова листинга
-        if re.search(r"(상장|리스트|listing|마켓\s*추가|market\s*support|new\s*listing)", title, re.I):
-            # фильтр по KRW/USDT в заголовке Notice
-            if not NOTICE_MARKET_PATTERN.search(title):
-                continue
-            uniq = hashlib.sha256((title + "|" + href).encode("utf-8")).hexdigest()[:16]
-            items.append({"id": uniq, "title": title, "url": href})
+    # парсинг синхронный и заметно грузит CPU — уносим его из event loop
+    items = await asyncio.to_thread(_parse_notices, html)
+    _notices_etag = resp.headers.get("ETag")
+    _notices_lastmod = resp.headers.get("Last-Modified")
+    _last_parsed_notices = items
     return items
 
 # ===================== ЛОГИКА =====================
-def detect_new_markets(old_set, markets):
-    current = {m["market"] for m in markets}
-    return sorted(current - old_set), current
+def next_poll_delay(fail_streak, not_modified):
+    # ±10% джиттера, чтобы не опрашивать Upbit синхронно с другими ботами в начале минуты
+    delay = POLL_INTERVAL_SEC * (0.9 + 0.2 * random.random())
+    if fail_streak:
+        # экспоненциальный откат; степень ограничена, чтобы не переполнить float
+        return min(delay * 2 ** min(fail_streak, 10), POLL_INTERVAL_MAX_SEC)
+    if not_modified:
+        # 304 почти ничего не стоит — можно опрашивать чаще
+        delay *= 0.5
+    return delay
+
+def detect_new_markets(old_set, current):
+    return sorted(current - old_set)
 
 def _passes_prefix_filter(market_code: str) -> bool:
-    up = market_code.upper()
-    return any(up.startswith(pref) for pref in FILTER_MARKETS)
+    # код рынка вида "KRW-BTC": префикс до первого "-" — один поиск в множестве
+    quote, sep, _ = market_code.partition("-")
+    return bool(sep) and (quote.upper() + "-") in FILTER_PREFIX_SET
 
-def notify_new_markets(new_markets, markets):
+def format_new_markets(new_markets, names):
     filtered = [mk for mk in new_markets if _passes_prefix_filter(mk)]
     if not filtered:
-        return
-    info = {m["market"]: m for m in markets}
+        return None
     lines = []
     for mk in filtered:
-        eng = info[mk].get("english_name", "")
-        kor = info[mk].get("korean_name", "")
+        eng, kor = names.get(mk, ("", ""))
         lines.append(f"• {mk} — {eng} / {kor}")
-    text = (
+    return (
         "🆕 Upbit: новые рынки (" + ",".join(p.rstrip('-') for p in FILTER_MARKETS) + ")\n"
         + "\n".join(lines)
         + f"\n\nИсточник API: {UPBIT_MARKETS_URL}"
     )
-    send_message(text)
 
-def notify_new_notices(new_items):
+def format_new_notices(new_items):
     if not new_items:
-        return
+        return None
     lines = [f"• {it['title']}\n  {it['url']}" for it in new_items]
-    send_message("📢 Upbit: новое объявление о листинге (KRW/USDT):\n" + "\n\n".join(lines))
+    return "📢 Upbit: новое объявление о листинге (KRW/USDT):\n" + "\n\n".join(lines)
 
-def bootstrap_baseline():
+async def bootstrap_baseline():
     """Первый запуск: фиксируем текущее состояние, чтобы не спамить историей."""
     try:
-        markets = fetch_markets()
-        current_markets = sorted({m["market"] for m in markets})
+        current, _ = await fetch_markets()
+        current_markets = sorted(current)
         save_cache(CACHE_FILE, {"markets": current_markets})
         log.info("Baseline markets saved: %d", len(current_markets))
     except Exception as e:
         log.exception("Bootstrap markets failed: %s", e)
 
     try:
-        notices = fetch_listing_notices()
+        notices = await fetch_listing_notices()
         ids = sorted({n["id"] for n in notices})
-        save_cache(NOTICES_CACHE_FILE, {"ids": ids})
+        save_cache(NOTICES_CACHE_FILE, {"ids": ids, "id_algo": NOTICE_ID_ALGO})
         log.info("Baseline notices saved: %d", len(ids))
     except Exception as e:
         log.exception("Bootstrap notices failed: %s", e)
 
-def main_loop():
+async def main_loop():
     global last_cycle_ok
     markets_cache = load_cache(CACHE_FILE, {"markets": []})
-    known_markets = set(markets_cache.get("markets", []))
+    # отсортированная копия для записи в кэш: обновляем слиянием, а не полной сортировкой
+    known_markets_sorted = sorted(markets_cache.get("markets", []))
+    known_markets = frozenset(known_markets_sorted)
 
     notices_cache = load_cache(NOTICES_CACHE_FILE, {"ids": []})
-    known_notice_ids = set(notices_cache.get("ids", []))
+    # dict как упорядоченное множество: порядок добавления нужен для обрезки старых id
+    known_notice_ids = dict.fromkeys(notices_cache.get("ids", []))
+    legacy_ids = notices_cache.get("id_algo") != NOTICE_ID_ALGO
 
-    send_message("🚀 Upbit бот запущен")
+    send_in_background("🚀 Upbit бот запущен")
+    fail_streak = 0
 
     while True:
+        pending_texts = []  # всё, что набралось за цикл, уходит одним сообщением
+
+        # оба источника независимы — тянем их параллельно
+        markets_res, notices_res = await asyncio.gather(
+            fetch_markets(known_markets), fetch_listing_notices(), return_exceptions=True
+        )
+
         # 1) рынки (критично)
         try:
-            markets = fetch_markets()
-            new_markets, current = detect_new_markets(known_markets, markets)
+            if isinstance(markets_res, BaseException):
+                raise markets_res
+            current, names = markets_res
+            new_markets = detect_new_markets(known_markets, current)
             if new_markets:
                 log.info("Найдены новые рынки (до фильтра): %s", new_markets)
-                notify_new_markets(new_markets, markets)
+                text = format_new_markets(new_markets, names)
+                if text:
+                    pending_texts.append(text)
+                if len(current) == len(known_markets) + len(new_markets):
+                    # только добавления: оба списка уже отсортированы — слияние за O(n)
+                    known_markets_sorted = list(heapq.merge(known_markets_sorted, new_markets))
+                else:
+                    # какие-то рынки исчезли — пересобираем
+                    known_markets_sorted = sorted(current)
                 known_markets = current
-                save_cache(CACHE_FILE, {"markets": sorted(list(known_markets))})
+                save_cache(CACHE_FILE, {"markets": known_markets_sorted})
             markets_ok = True
         except Exception as e:
             markets_ok = False
@@ -245,32 +476,58 @@ def main_loop():
 
         # 2) объявления (некритично)
         try:
-            notices = fetch_listing_notices()
+            if isinstance(notices_res, BaseException):
+                raise notices_res
+            notices = notices_res
             fresh = [n for n in notices if n["id"] not in known_notice_ids]
+            rekeyed = []
+            if fresh and legacy_ids:
+                # кэш со старыми sha256-id: уже виденные объявления перепривязываем без уведомления
+                unseen = []
+                for n in fresh:
+                    (rekeyed if _legacy_notice_id(n) in known_notice_ids else unseen).append(n)
+                fresh = unseen
             if fresh:
                 log.info("Найдены новые листинговые объявления: %d", len(fresh))
-                notify_new_notices(fresh)
-                known_notice_ids |= {n["id"] for n in fresh}
-                save_cache(NOTICES_CACHE_FILE, {"ids": sorted(list(known_notice_ids))})
+                pending_texts.append(format_new_notices(fresh))
+            if fresh or rekeyed:
+                known_notice_ids.update(dict.fromkeys(n["id"] for n in rekeyed + fresh))
+                if len(known_notice_ids) > NOTICES_CACHE_MAX:
+                    known_notice_ids = dict.fromkeys(list(known_notice_ids)[-NOTICES_CACHE_MAX:])
+                save_cache(NOTICES_CACHE_FILE, {"ids": list(known_notice_ids), "id_algo": NOTICE_ID_ALGO})
+                legacy_ids = False
             notices_ok = True
         except Exception as e:
             notices_ok = False
             log.exception("Ошибка notices: %s", e)
 
+        if pending_texts:
+            send_in_background("\n\n".join(pending_texts))
+
         if markets_ok:
             mark_ok()
         else:
             mark_fail()
 
-        time.sleep(POLL_INTERVAL_SEC)
-
-# ===================== ЗАПУСК =====================
-if __name__ == "__main__":
-    threading.Thread(target=run_http, daemon=True).start()
+        fail_streak = 0 if markets_ok else fail_streak + 1
+        await asyncio.sleep(next_poll_delay(fail_streak, _notices_not_modified))
 
+async def run_poller():
     if not os.path.exists(CACHE_FILE) or not os.path.exists(NOTICES_CACHE_FILE):
         log.info("Cache not found, creating baseline...")
-        bootstrap_baseline()
+        await bootstrap_baseline()
 
     log.info("Фильтр рынков: %s", ",".join(p.rstrip('-') for p in FILTER_MARKETS))
-    main_loop()
\ No newline at end of file
+    await main_loop()
+
+async def main():
+    http_task = asyncio.create_task(serve_http())
+    try:
+        await run_poller()
+    finally:
+        http_task.cancel()
+        await HTTP.aclose()
+
+# ===================== ЗАПУСК =====================
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
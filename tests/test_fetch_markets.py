@@ -0,0 +1,57 @@
+import asyncio
+import importlib.util
+import os
+from pathlib import Path
+
+import httpx
+import orjson
+
+os.environ.setdefault("TG_TOKEN", "123456:" + "A" * 35)
+
+_spec = importlib.util.spec_from_file_location("upbit_bot", Path(__file__).resolve().parent.parent / "1.py")
+bot = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bot)
+
+MARKETS = [
+    {"market": "KRW-BTC", "korean_name": "비트코인", "english_name": "Bitcoin"},
+    {"market": "KRW-NEW", "korean_name": "새코인", "english_name": "Newcoin"},
+    {"market": "BTC-ETH", "korean_name": "이더리움", "english_name": "Ethereum"},
+]
+
+
+class _ChunkedStream(httpx.AsyncByteStream):
+    def __init__(self, body, chunk_size):
+        self._body = body
+        self._chunk_size = chunk_size
+
+    async def __aiter__(self):
+        for i in range(0, len(self._body), self._chunk_size):
+            yield self._body[i:i + self._chunk_size]
+
+
+def _fetch(chunk_size):
+    body = orjson.dumps(MARKETS)
+
+    def handler(request):
+        return httpx.Response(200, stream=_ChunkedStream(body, chunk_size))
+
+    async def run():
+        bot.HTTP = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await bot.fetch_markets(frozenset({"KRW-BTC"}))
+        finally:
+            await bot.HTTP.aclose()
+
+    return asyncio.run(run())
+
+
+def test_fetch_markets_single_chunk():
+    current, names = _fetch(chunk_size=1 << 20)
+    assert current == {"KRW-BTC", "KRW-NEW", "BTC-ETH"}
+    assert names == {"KRW-NEW": ("Newcoin", "새코인")}
+
+
+def test_fetch_markets_multi_chunk():
+    current, names = _fetch(chunk_size=7)
+    assert current == {"KRW-BTC", "KRW-NEW", "BTC-ETH"}
+    assert names == {"KRW-NEW": ("Newcoin", "새코인")}